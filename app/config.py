@@ -3,9 +3,10 @@ Configuration management for the drone PDF extraction service.
 """
 
 import os
+from functools import cached_property
 from pathlib import Path
-from pydantic_settings import BaseSettings
-from typing import Optional
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from typing import Optional, Tuple
 
 
 class Settings(BaseSettings):
@@ -21,6 +22,8 @@ class Settings(BaseSettings):
     
     # File Processing
     max_file_size: int = 10 * 1024 * 1024  # 10MB
+    max_in_flight_bytes: int = 256 * 1024 * 1024  # 256MB of decoded PDFs / raw uploads extracted at once
+    map_render_dpi: Optional[int] = None  # Defaults to 96, or 150 for small pages
     
     # CORS
     cors_origins: str = "*"  # Comma-separated list of allowed origins
@@ -31,26 +34,36 @@ class Settings(BaseSettings):
     cloudinary_api_secret: Optional[str] = None
     cloudinary_folder: str = "starhawk-map-images"
     
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
-        case_sensitive = False
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        case_sensitive=False,
         extra="allow"
-        
-    def get_upload_dir(self) -> str:
-        """Get the upload directory path, defaulting if not set."""
+    )
+
+    @cached_property
+    def resolved_upload_dir(self) -> str:
+        """Upload directory path, computed once."""
         if self.upload_dir:
             return self.upload_dir
         
         # Default to ./uploads/drone-analysis relative to project root
-        project_root = Path(__file__).parent.parent.parent
-        return str(project_root / "uploads" / "drone-analysis")
+        return str(Path(__file__).resolve().parents[2] / "uploads" / "drone-analysis")
     
-    def get_cors_origins_list(self) -> list:
-        """Parse CORS origins string into a list."""
+    @cached_property
+    def cors_origins_list(self) -> Tuple[str, ...]:
+        """CORS origins parsed once from the comma-separated setting."""
         if self.cors_origins == "*":
-            return ["*"]
-        return [origin.strip() for origin in self.cors_origins.split(",")]
+            return ("*",)
+        return tuple(origin.strip() for origin in self.cors_origins.split(","))
+        
+    def get_upload_dir(self) -> str:
+        """Get the upload directory path, defaulting if not set."""
+        return self.resolved_upload_dir
+    
+    def get_cors_origins_list(self) -> list:
+        """Get the parsed CORS origins as a list."""
+        return list(self.cors_origins_list)
 
 
 # Global settings instance
@@ -5,28 +5,92 @@ Supports: Plant Stress, Flowering, and extensible for future types
 With Cloudinary upload for map images (no base64 in response)
 """
 
+import asyncio
+import copy
 import fitz
+import itertools
 import re
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
-from typing import Optional, Dict, Any, List, Tuple
+from functools import lru_cache
+from typing import Optional, Dict, Any, Iterable, Iterator, List, Tuple, Union
 
-import cloudinary
-import cloudinary.uploader
-from cloudinary.exceptions import Error as CloudinaryError
 from app.config import settings
 
-if settings.cloudinary_cloud_name and settings.cloudinary_api_key and settings.cloudinary_api_secret:
+logger = __import__('logging').getLogger(__name__)
+
+# Precompiled patterns used while parsing page 1
+_DATE_FALLBACK_RE = re.compile(r'(\d{2}-\d{2}-\d{4})')
+# Capped at 100 chars: names of 50+ chars are discarded anyway, and the cap keeps a missing
+# terminator word from walking the lazy match to the end of the page
+_ANALYSIS_NAME_RE = re.compile(r'Analysis\s+name:\s*([\w\s]{1,100}?)(?:\s+(?:Growing|Field|STRESS|Total|Additional)|$)',
+                               re.I)
+_BBCH_RE = re.compile(r'BBCH\s*\d+|BBCH\d+', re.I)
+# A number is "12", "12.5", "12." or ".5", so every capture is a valid float() literal.
+# The lookbehind stops a malformed token ("1.2.3") from matching as a shorter wrong number
+_NUMBER = r'(?<![\d.])(\d+\.?\d*|\.\d+)'
+_HECTARE_RE = re.compile(_NUMBER + r'\s*Hectare', re.I)
+# Total area row: "X ha = Y% field" or just "Y% field" (group 1 is None then)
+_TOTAL_AREA_RE = re.compile(r'(?:' + _NUMBER + r'\s*ha\s*=\s*)?' + _NUMBER + r'%\s*field', re.I)
+_PCT_FIELD_RE = re.compile(_NUMBER + r'%\s*field', re.I)
+# Known crop names, looked up with plain substring search after the "Crop:" label
+_KNOWN_CROPS = ('sugar beet', 'wheat', 'corn', 'soybean', 'rice', 'barley', 'potato', 'tomato',
+                'cotton', 'canola', 'tobacco')
+# Fallback crop candidates when no known name is present: two words, then any longer word
+_CROP_PATTERNS = (
+    re.compile(r'([a-z]+\s+[a-z]+)', re.I),
+    re.compile(r'([a-z]{4,})', re.I),
+)
+# Report words the fallback crop patterns can pick up that are never a crop
+_CROP_LABEL_BLOCKLIST = frozenset({'total', 'area', 'stress', 'field', 'growing', 'stage',
+                                   'analysis', 'name', 'plant', 'health', 'monitoring', 'flowering'})
+# One pass over page 1 finds the labelled survey date and the field label positions
+_PAGE1_LABELS_RE = re.compile(
+    r'(?i:Survey\s+date:)\s*(?P<survey_date>\d{2}-\d{2}-\d{4})|(?P<label>Crop:|Growing stage:|Field area:)'
+)
+# Capped at 200 chars: longer comments are discarded anyway, and the cap keeps a missing
+# "Powered" footer from dragging the lazy match across the rest of the page
+_ADDITIONAL_INFO_RE = re.compile(r'Additional\s+Information\s*\(or\s+recommendation\):\s*(.{1,200}?)(?:\s+Powered|$)',
+                                 re.I | re.DOTALL)
+
+
+_CLOUDINARY_NOT_CONFIGURED = "cloudinary not configured"
+# Makes public_ids unique within a process when several uploads start in the same second
+_PUBLIC_ID_COUNTER = itertools.count()
+
+# Resolution for maps rendered from the page (no embedded image); pages under
+# _SMALL_PAGE_AREA_IN square inches are rendered at the higher dpi
+_DEFAULT_RENDER_DPI = 96
+_SMALL_PAGE_RENDER_DPI = 150
+_SMALL_PAGE_AREA_IN = 25
+
+
+def _cloudinary_configured() -> bool:
+    return bool(settings.cloudinary_cloud_name and settings.cloudinary_api_key and settings.cloudinary_api_secret)
+
+
+if not _cloudinary_configured():
+    logger.warning("Cloudinary credentials not configured in settings; map images will not be uploaded")
+
+
+@lru_cache(maxsize=1)
+def _get_cloudinary_uploader():
+    """Import and configure Cloudinary on first upload (only reached when it is configured); returns (uploader module, SDK error class)"""
+    import cloudinary
+    import cloudinary.uploader
+    from cloudinary.exceptions import Error as CloudinaryError
+
     cloudinary.config(
         cloud_name=settings.cloudinary_cloud_name,
         api_key=settings.cloudinary_api_key,
         api_secret=settings.cloudinary_api_secret,
         secure=True
     )
-else:
-    print("Warning: Cloudinary credentials not configured in settings")
 
-logger = __import__('logging').getLogger(__name__)
+    return cloudinary.uploader, CloudinaryError
 
 
 class AnalysisTypeConfig:
@@ -38,9 +102,9 @@ class AnalysisTypeConfig:
             "keywords": ["PLANT STRESS", "Plant Stress"],
             "total_area_pattern": r"total area plant stress:",
             "levels": [
-                {"name": "Fine", "severity": "healthy", "pattern": r'\bFine\s+([\d.]+)%\s+([\d.]+)\b'},
-                {"name": "Potential Plant Stress", "severity": "moderate", "pattern": r'\bPotential\s+Plant\s+Stress\s+([\d.]+)%\s+([\d.]+)\b'},
-                {"name": "Plant Stress", "severity": "high", "pattern": r'\bPlant\s+Stress\s+([\d.]+)%\s+([\d.]+)\b', "exclude_context": "potential"}
+                {"name": "Fine", "severity": "healthy"},
+                {"name": "Potential Plant Stress", "severity": "moderate"},
+                {"name": "Plant Stress", "severity": "high"}
             ],
             "field_name": "weed_analysis"  # Generic name instead of "weed_analysis"
         },
@@ -48,9 +112,9 @@ class AnalysisTypeConfig:
             "keywords": ["FLOWERING", "Flowering"],
             "total_area_pattern": r"total area flowering:",
             "levels": [
-                {"name": "Full Flowering", "severity": "high", "pattern": r'\bFull\s+Flowering\s+([\d.]+)%\s+([\d.]+)\b'},
-                {"name": "Flowering", "severity": "moderate", "pattern": r'\bFlowering\s+([\d.]+)%\s+([\d.]+)\b', "exclude_context": "full|no"},
-                {"name": "No Flowering", "severity": "low", "pattern": r'\bNo\s+Flowering\s+([\d.]+)%\s+([\d.]+)\b'}
+                {"name": "Full Flowering", "severity": "high"},
+                {"name": "Flowering", "severity": "moderate"},
+                {"name": "No Flowering", "severity": "low"}
             ],
             "field_name": "weed_analysis"
         },
@@ -64,20 +128,77 @@ class AnalysisTypeConfig:
     }
 
 
+def _normalize_label(label: str) -> str:
+    return ' '.join(label.lower().split())
+
+
+def _compile_levels_re(levels: List[Dict[str, Any]]) -> re.Pattern:
+    """Build one pattern matching every level row of an analysis type (single scan)"""
+    # The scan runs left to right, so a longer name ("Potential Plant Stress",
+    # "No Flowering") consumes its row before the shorter name inside it can match.
+    # Names starting at the same position are tried longest first.
+    names = sorted((level["name"] for level in levels), key=len, reverse=True)
+    labels = '|'.join(r'\s+'.join(map(re.escape, name.split())) for name in names)
+    return re.compile(r'\b(' + labels + r')\s+' + _NUMBER + r'%\s+' + _NUMBER + r'(?!\.?\d)', re.I)
+
+
+# Per analysis type: detection keywords, lowercased once (duplicates differing only in case dropped)
+_KEYWORDS_LOWER = {
+    type_key: tuple(dict.fromkeys(keyword.lower() for keyword in config["keywords"]))
+    for type_key, config in AnalysisTypeConfig.TYPES.items()
+}
+
+# Per analysis type: case-insensitive total area label, e.g. "Total area PLANT STRESS:"
+_TOTAL_LABEL_RES = {
+    type_key: re.compile(r'\s+'.join(map(re.escape, config["total_area_pattern"].split())), re.I)
+    for type_key, config in AnalysisTypeConfig.TYPES.items()
+}
+
+# Per analysis type: (levels pattern, level config keyed by normalized name)
+_LEVEL_MATCHERS = {
+    type_key: (
+        _compile_levels_re(config["levels"]),
+        {_normalize_label(level["name"]): level for level in config["levels"]}
+    )
+    for type_key, config in AnalysisTypeConfig.TYPES.items()
+}
+
+
 class AgremoReportExtractor:
-    def __init__(self, pdf_path: str):
+    __slots__ = ("pdf_path", "pdf_bytes", "_doc", "_doc_task", "_start", "_cloudinary_enabled", "analysis_type", "analysis_config", "result")
+
+    def __init__(self, pdf_path: str, pdf_bytes: Optional[bytes] = None):
         self.pdf_path = pdf_path
-        self.doc = fitz.open(pdf_path)
+        self.pdf_bytes = pdf_bytes  # PDF already in memory: opened from here, pdf_path only names it
+        self._doc = None  # Opened on first access, see the doc property
+        self._doc_task = None  # Executor future currently reading the document (extract_async)
+        self._start = datetime.now()  # Shared by metadata and the Cloudinary public_id
+        self._cloudinary_enabled = _cloudinary_configured()
         self.analysis_type = None  # Will be detected during parsing
         self.analysis_config = None
         self.result = self._init_result_structure()
 
+    @property
+    def doc(self) -> fitz.Document:
+        if self._doc is None:
+            if self.pdf_bytes is not None:
+                self._doc = fitz.open(stream=self.pdf_bytes, filetype="pdf")
+            else:
+                self._doc = fitz.open(self.pdf_path, filetype="pdf")
+        return self._doc
+
+    def __enter__(self) -> "AgremoReportExtractor":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
     def _init_result_structure(self) -> Dict[str, Any]:
         return {
             "metadata": {
                 "source_file": os.path.basename(self.pdf_path),
-                "extracted_at": datetime.now().isoformat(),
-                "total_pages": len(self.doc),
+                "extracted_at": self._start.isoformat(),
+                "total_pages": None,  # Set by extract() once the document is opened
                 "extractor_version": "3.0-unified"
             },
             "report": {
@@ -98,16 +219,7 @@ class AgremoReportExtractor:
                 "levels": []
             },
             "additional_info": None,
-            "map_image": {
-                "source": None,
-                "url": None,
-                "public_id": None,
-                "width": None,
-                "height": None,
-                "format": None,
-                "bytes": None,
-                "error": None
-            }
+            "map_image": None  # Set by extract() when the report has a map page
         }
 
     def _detect_analysis_type(self, text: str) -> Tuple[Optional[str], Optional[Dict]]:
@@ -118,41 +230,40 @@ class AgremoReportExtractor:
         text_lower = text.lower()
 
         for type_key, config in AnalysisTypeConfig.TYPES.items():
-            for keyword in config["keywords"]:
-                if keyword.lower() in text_lower:
+            for keyword in _KEYWORDS_LOWER[type_key]:
+                if keyword in text_lower:
                     logger.info(f"Detected analysis type: {type_key} (keyword: '{keyword}')")
                     return type_key, config
 
         logger.warning("Could not detect analysis type from PDF")
         return None, None
 
-    def _parse_page1_text(self, text: str) -> None:
+    def _parse_page1_text(self) -> None:
         blocks = self.doc[0].get_text("blocks")
-        full_text = '\n'.join([b[4].strip() for b in blocks if len(b[4].strip()) > 3])
-        full_text_spaced = ' '.join([b[4].strip() for b in blocks if len(b[4].strip()) > 3])
-        lower_full = full_text.lower()
-        lower_full_spaced = full_text_spaced.lower()
+        parts = [text for text in (b[4].strip() for b in blocks) if len(text) > 3]
+        full_text = ' '.join(parts)
 
         # Detect analysis type first
         self.analysis_type, self.analysis_config = self._detect_analysis_type(full_text)
         if self.analysis_type:
             self.result["report"]["detected_analysis_type"] = self.analysis_type
 
-        # Survey date
-        date_match = re.search(r'Survey\s+date:\s*(\d{2}-\d{2}-\d{4})', full_text_spaced, re.I)
-        if not date_match:
-            date_match = re.search(r'(\d{2}-\d{2}-\d{4})', full_text_spaced)
-        if date_match:
-            self.result["report"]["survey_date"] = date_match.group(1)
+        # Survey date and label positions for the field section (labels are not in a fixed order)
+        survey_date, label_offsets = self._scan_labels(full_text)
+        if not survey_date:
+            date_match = _DATE_FALLBACK_RE.search(full_text)
+            if date_match:
+                survey_date = date_match.group(1)
+        self.result["report"]["survey_date"] = survey_date
 
-        # Report type
-        if "Crop Monitoring" in full_text:
-            self.result["report"]["type"] = "Crop Monitoring"
+        # Report type ("Plant Health Monitoring" takes precedence)
         if "Plant Health Monitoring" in full_text:
             self.result["report"]["type"] = "Plant Health Monitoring"
+        elif "Crop Monitoring" in full_text:
+            self.result["report"]["type"] = "Crop Monitoring"
 
         # Analysis name
-        analysis_match = re.search(r'Analysis\s+name:\s*([\w\s]+?)(?:\s+(?:Growing|Field|STRESS|Total|Additional)|$)', full_text_spaced, re.I)
+        analysis_match = _ANALYSIS_NAME_RE.search(full_text)
         if analysis_match:
             name = analysis_match.group(1).strip()
             if "STRESS LEVEL" not in name.upper() and len(name) < 50:
@@ -166,200 +277,155 @@ class AgremoReportExtractor:
                     break
 
         # Crop extraction
-        self._extract_crop(full_text_spaced)
+        self._extract_crop(full_text, label_offsets.get("Crop:", -1))
 
         # Growing stage
-        self._extract_growing_stage(full_text_spaced)
+        self._extract_growing_stage(full_text, label_offsets.get("Growing stage:", -1))
 
         # Field area
-        self._extract_field_area(full_text_spaced)
+        self._extract_field_area(full_text, label_offsets.get("Field area:", -1))
 
-        # Total area & percentage (dynamic based on analysis type)
-        self._extract_total_area(lower_full_spaced)
+        # Total area and levels depend on the analysis type; undetected reports keep the generic fields
+        if self.analysis_config:
+            # Total area & percentage (dynamic based on analysis type)
+            self._extract_total_area(full_text)
 
-        # Extract levels (dynamic based on analysis type)
-        self._extract_levels(full_text_spaced)
+            # Extract levels (dynamic based on analysis type)
+            self._extract_levels(full_text)
 
         # Additional info
-        self._extract_additional_info(full_text, full_text_spaced)
-
-    def _extract_crop(self, full_text_spaced: str) -> None:
+        self._extract_additional_info(full_text)
+
+    @staticmethod
+    def _scan_labels(full_text: str) -> Tuple[Optional[str], Dict[str, int]]:
+        """Find the labelled survey date and the first offset of every field label in a single pass"""
+        survey_date = None
+        offsets = {}
+        for match in _PAGE1_LABELS_RE.finditer(full_text):
+            label = match.group("label")
+            if label:
+                offsets.setdefault(label, match.start())
+            elif survey_date is None:
+                survey_date = match.group("survey_date")
+        return survey_date, offsets
+
+    def _extract_crop(self, full_text: str, crop_label_pos: int) -> None:
         """Extract crop information"""
-        crop_label_pos = full_text_spaced.find("Crop:")
         if crop_label_pos >= 0:
-            crop_patterns = [
-                r'(?:sugar\s+beet|wheat|corn|soybean|rice|barley|potato|tomato|cotton|canola|tobacco)',
-                r'([a-z]+\s+[a-z]+)',
-                r'([a-z]{4,})',
-            ]
             search_start = crop_label_pos + 5
-            search_text = full_text_spaced[search_start:search_start + 200].lower()
-
-            excluded_words = ['total', 'area', 'stress', 'field', 'growing', 'stage',
-                              'analysis', 'name', 'plant', 'health', 'monitoring', 'flowering']
-
-            for pattern in crop_patterns:
-                match = re.search(pattern, search_text, re.I)
+            search_text = full_text[search_start:search_start + 200].lower()
+
+            # Earliest known crop name wins; whitespace is collapsed so "sugar\nbeet" still matches
+            collapsed = ' '.join(search_text.split())
+            known = None
+            for crop in _KNOWN_CROPS:
+                pos = collapsed.find(crop)
+                if pos >= 0 and (known is None or pos < known[0]):
+                    known = (pos, crop)
+            if known:
+                self.result["field"]["crop"] = known[1]
+                return
+
+            for pattern in _CROP_PATTERNS:
+                match = pattern.search(search_text)
                 if match:
                     crop = match.group(1 if match.lastindex else 0).strip()
-                    if crop and crop.lower() not in excluded_words:
+                    if crop and crop.lower() not in _CROP_LABEL_BLOCKLIST:
                         self.result["field"]["crop"] = crop
                         break
 
-    def _extract_growing_stage(self, full_text_spaced: str) -> None:
+    def _extract_growing_stage(self, full_text: str, stage_label_pos: int) -> None:
         """Extract growing stage (BBCH code)"""
-        stage_label_pos = full_text_spaced.find("Growing stage:")
         if stage_label_pos >= 0:
-            search_text = full_text_spaced[stage_label_pos:stage_label_pos + 100]
-            stage_match = re.search(r'BBCH\s*\d+|BBCH\d+', search_text, re.I)
+            stage_match = _BBCH_RE.search(full_text, stage_label_pos, stage_label_pos + 100)
             if stage_match:
                 self.result["field"]["growing_stage"] = stage_match.group(0).strip()
             else:
-                stage_match = re.search(r'BBCH\s*\d+|BBCH\d+', full_text_spaced, re.I)
+                stage_match = _BBCH_RE.search(full_text)
                 if stage_match:
                     self.result["field"]["growing_stage"] = stage_match.group(0).strip()
 
-    def _extract_field_area(self, full_text_spaced: str) -> None:
+    def _extract_field_area(self, full_text: str, area_label_pos: int) -> None:
         """Extract field area in hectares"""
-        area_label_pos = full_text_spaced.find("Field area:")
         if area_label_pos >= 0:
-            search_text = full_text_spaced[area_label_pos:area_label_pos + 100]
-            area_match = re.search(r'([\d.]+)\s*Hectare', search_text, re.I)
+            area_match = _HECTARE_RE.search(full_text, area_label_pos, area_label_pos + 100)
             if area_match:
-                try:
-                    self.result["field"]["area_hectares"] = float(area_match.group(1))
-                except ValueError:
-                    pass
+                self.result["field"]["area_hectares"] = float(area_match.group(1))
         else:
-            area_match = re.search(r'([\d.]+)\s*Hectare', full_text_spaced, re.I)
+            area_match = _HECTARE_RE.search(full_text)
             if area_match:
-                try:
-                    self.result["field"]["area_hectares"] = float(area_match.group(1))
-                except ValueError:
-                    pass
+                self.result["field"]["area_hectares"] = float(area_match.group(1))
+
+    def _match_total_area(self, full_text: str, pos: int, endpos: int, where: str) -> bool:
+        """Apply the first "X ha = Y% field" in text[pos:endpos], else the first "Y% field"; one scan"""
+        percent_match = None
+        for match in _TOTAL_AREA_RE.finditer(full_text, pos, endpos):
+            if match.group(1) is not None:
+                self.result["weed_analysis"]["total_area_hectares"] = float(match.group(1))
+                self.result["weed_analysis"]["total_area_percent"] = float(match.group(2))
+                logger.info(f"Extracted total area {where}: {match.group(1)} ha = {match.group(2)}%")
+                return True
+            if percent_match is None:
+                percent_match = match
 
-    def _extract_total_area(self, lower_full_spaced: str) -> None:
-        """Extract total area and percentage (dynamic based on analysis type)"""
-        if not self.analysis_config:
-            logger.warning("No analysis config detected, skipping total area extraction")
-            return
+        if percent_match:
+            self.result["weed_analysis"]["total_area_percent"] = float(percent_match.group(2))
+            logger.info(f"Extracted percentage {where}: {percent_match.group(2)}%")
+            return True
+        return False
 
-        # Use the pattern from the config
-        total_pattern = self.analysis_config["total_area_pattern"]
-        total_label_pos = lower_full_spaced.find(total_pattern)
+    def _extract_total_area(self, full_text: str) -> None:
+        """Extract total area and percentage (dynamic based on analysis type)"""
+        # Use the label from the config (all patterns below are case-insensitive)
+        total_label_match = _TOTAL_LABEL_RES[self.analysis_type].search(full_text)
+        total_label_pos = total_label_match.start() if total_label_match else -1
 
         if total_label_pos >= 0:
-            # Search AFTER the label (Plant Stress format: "Total area PLANT STRESS: 22.04 ha = 69% field")
-            search_text_after = lower_full_spaced[total_label_pos:total_label_pos + 200]
-
-            # Try pattern 1: "X ha = Y% field" (Plant Stress format)
-            total_match = re.search(r'([\d.]+)\s*ha\s*=\s*([\d.]+)%\s*field', search_text_after, re.I)
-            if total_match:
-                try:
-                    self.result["weed_analysis"]["total_area_hectares"] = float(total_match.group(1))
-                    self.result["weed_analysis"]["total_area_percent"] = float(total_match.group(2))
-                    logger.info(f"Extracted total area from pattern 1: {total_match.group(1)} ha = {total_match.group(2)}%")
-                    return  # Success, exit
-                except (ValueError, IndexError) as e:
-                    logger.error(f"Error parsing total area pattern 1: {e}")
-
-            # Pattern 2: "Y% field" after label (Flowering format)
-            percent_match = re.search(r'([\d.]+)%\s*field', search_text_after, re.I)
-            if percent_match:
-                try:
-                    self.result["weed_analysis"]["total_area_percent"] = float(percent_match.group(1))
-                    logger.info(f"Extracted percentage from after label: {percent_match.group(1)}%")
-                    return  # Success, exit
-                except (ValueError, IndexError) as e:
-                    logger.error(f"Error parsing total area pattern 2: {e}")
-
-            # Pattern 3: Search BEFORE the label (Flowering alternative format: "6.58% field\nTotal area FLOWERING:")
-            search_text_before = lower_full_spaced[max(0, total_label_pos - 100):total_label_pos]
-            percent_match_before = re.search(r'([\d.]+)%\s*field', search_text_before, re.I)
+            # Search AFTER the label: "X ha = Y% field" (Plant Stress format: "Total area PLANT STRESS:
+            # 22.04 ha = 69% field"), else "Y% field" (Flowering format)
+            if self._match_total_area(full_text, total_label_pos, total_label_pos + 200, "after label"):
+                return  # Success, exit
+
+            # Search BEFORE the label (Flowering alternative format: "6.58% field\nTotal area FLOWERING:")
+            percent_match_before = _PCT_FIELD_RE.search(full_text, max(0, total_label_pos - 100), total_label_pos)
             if percent_match_before:
-                try:
-                    self.result["weed_analysis"]["total_area_percent"] = float(percent_match_before.group(1))
-                    logger.info(f"Extracted percentage from before label: {percent_match_before.group(1)}%")
-                    return  # Success, exit
-                except (ValueError, IndexError) as e:
-                    logger.error(f"Error parsing percentage before label: {e}")
-
-        # Fallback 1: search entire text for "X ha = Y% field"
-        total_match = re.search(r'([\d.]+)\s*ha\s*=\s*([\d.]+)%\s*field', lower_full_spaced, re.I)
-        if total_match:
-            try:
-                self.result["weed_analysis"]["total_area_hectares"] = float(total_match.group(1))
-                self.result["weed_analysis"]["total_area_percent"] = float(total_match.group(2))
-                logger.info(f"Extracted total area from fallback 1: {total_match.group(1)} ha = {total_match.group(2)}%")
+                self.result["weed_analysis"]["total_area_percent"] = float(percent_match_before.group(1))
+                logger.info(f"Extracted percentage from before label: {percent_match_before.group(1)}%")
                 return  # Success, exit
-            except (ValueError, IndexError) as e:
-                logger.error(f"Error parsing total area (fallback 1): {e}")
 
-        # Fallback 2: search entire text for "Y% field" only
-        percent_match = re.search(r'([\d.]+)%\s*field', lower_full_spaced, re.I)
-        if percent_match:
-            try:
-                self.result["weed_analysis"]["total_area_percent"] = float(percent_match.group(1))
-                logger.info(f"Extracted percentage from fallback 2: {percent_match.group(1)}%")
-            except (ValueError, IndexError) as e:
-                logger.error(f"Error parsing percentage (fallback 2): {e}")
+        # Fallback: search entire text the same way
+        self._match_total_area(full_text, 0, len(full_text), "from fallback")
 
-    def _extract_levels(self, full_text_spaced: str) -> None:
+    def _extract_levels(self, full_text: str) -> None:
         """Extract levels dynamically based on analysis type configuration"""
-        if not self.analysis_config:
-            logger.warning("No analysis config detected, skipping levels extraction")
-            return
-
-        levels = []
-        seen = set()
+        found: Dict[str, Dict[str, Any]] = {}
+        levels_re, levels_by_label = _LEVEL_MATCHERS[self.analysis_type]
 
-        for level_config in self.analysis_config["levels"]:
+        for match in levels_re.finditer(full_text):
+            level_config = levels_by_label[_normalize_label(match.group(1))]
             level_name = level_config["name"]
-            severity = level_config["severity"]
-            pattern = level_config["pattern"]
-            exclude_context = level_config.get("exclude_context", None)
-
-            matches = re.finditer(pattern, full_text_spaced, re.I)
-
-            for match in matches:
-                # Check exclude context if specified
-                if exclude_context:
-                    start_pos = match.start()
-                    context_start = max(0, start_pos - 20)
-                    context = full_text_spaced[context_start:start_pos].lower()
-
-                    # Check if any exclude keyword is in context
-                    exclude_keywords = exclude_context.split("|")
-                    if any(keyword in context for keyword in exclude_keywords):
-                        continue
-
-                # Create unique key to avoid duplicates
-                key = f"{level_name}_{match.group(1)}_{match.group(2)}"
-                if key not in seen:
-                    seen.add(key)
-                    try:
-                        percent = float(match.group(1))
-                        ha = float(match.group(2))
-
-                        # Always add the level (even 0% entries - they're still useful info)
-                        levels.append({
-                            "level": level_name,
-                            "severity": severity,
-                            "percentage": percent,
-                            "area_hectares": ha
-                        })
-                    except ValueError as e:
-                        logger.warning(f"Error parsing level {level_name}: {e}")
-
-        self.result["weed_analysis"]["levels"] = levels
-
-    def _extract_additional_info(self, full_text: str, full_text_spaced: str) -> None:
+
+            # First row per level wins; always add it (even 0% entries - they're still useful info)
+            if level_name not in found:
+                found[level_name] = {
+                    "level": level_name,
+                    "severity": level_config["severity"],
+                    "percentage": float(match.group(2)),
+                    "area_hectares": float(match.group(3))
+                }
+
+                # Stop scanning once every configured level has a row
+                if len(found) == len(levels_by_label):
+                    break
+
+        self.result["weed_analysis"]["levels"] = list(found.values())
+
+    def _extract_additional_info(self, full_text: str) -> None:
         """Extract additional information or recommendations"""
         if "Test comment" in full_text:
             self.result["additional_info"] = "Test comment"
         else:
-            info_match = re.search(r'Additional\s+Information\s*\(or\s+recommendation\):\s*(.+?)(?:\s+Powered|$)',
-                                   full_text_spaced, re.I | re.DOTALL)
+            info_match = _ADDITIONAL_INFO_RE.search(full_text)
             if info_match:
                 comment = info_match.group(1).strip()
                 if "Test comment" in comment:
@@ -369,12 +435,15 @@ class AgremoReportExtractor:
 
     def _upload_to_cloudinary(self, image_bytes: bytes, img_format: str) -> Dict[str, Any]:
         """Upload image bytes to Cloudinary and return relevant info"""
+        uploader, CloudinaryError = _get_cloudinary_uploader()
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            public_id = f"agremo_map_{timestamp}"
+            timestamp = self._start.strftime("%Y%m%d_%H%M%S")
+            # With overwrite=False a repeated public_id fails the upload, so add pid and a counter
+            public_id = f"agremo_map_{timestamp}_{os.getpid()}_{next(_PUBLIC_ID_COUNTER)}"
 
-            upload_result = cloudinary.uploader.upload(
-                image_bytes,
+            # A (filename, data) tuple is posted as a named multipart part without copying the bytes
+            upload_result = uploader.upload(
+                (f"{public_id}.{img_format.lower()}", image_bytes),
                 resource_type="image",
                 public_id=public_id,
                 folder=settings.cloudinary_folder or "drone-reports",
@@ -398,8 +467,9 @@ class AgremoReportExtractor:
             logger.error(f"Unexpected error during Cloudinary upload: {str(e)}")
             return {"error": str(e)}
 
-    def _extract_map_image(self, page_num: int = 1, output_dir: Optional[str] = None) -> Dict[str, Any]:
-        """Extract map image from specified page"""
+    def _get_map_bytes(self, page_num: int = 1, output_dir: Optional[str] = None,
+                       dpi: Optional[int] = None) -> Dict[str, Any]:
+        """Get the map image bytes from specified page (no upload); dpi only applies to page renders"""
         if page_num >= len(self.doc):
             return {"error": "Page not found"}
 
@@ -413,56 +483,65 @@ class AgremoReportExtractor:
         source = "unknown"
 
         if image_list:
-            # Extract embedded images
-            images_data = []
-            for img in image_list:
-                xref = img[0]
-                base_image = self.doc.extract_image(xref)
-                bytes_data = base_image["image"]
-                images_data.append({
-                    "bytes": bytes_data,
-                    "format": base_image["ext"],
-                    "size": len(bytes_data),
-                    "width": base_image.get("width", 0),
-                    "height": base_image.get("height", 0),
-                })
-
-            # Use the largest image
-            largest = max(images_data, key=lambda x: x["size"])
-            image_bytes = largest["bytes"]
-            img_format = largest["format"]
-            width = largest["width"]
-            height = largest["height"]
+            # Pick the largest image by its pixel dimensions so only that one gets decoded.
+            # Soft masks have the same size as the image they belong to, so skip them.
+            smask_xrefs = {img[1] for img in image_list if img[1]}
+            candidates = [img for img in image_list if img[0] not in smask_xrefs] or image_list
+            largest = max(candidates, key=lambda img: img[2] * img[3])
+
+            base_image = self.doc.extract_image(largest[0])
+            image_bytes = base_image["image"]
+            img_format = base_image["ext"]
+            width = base_image.get("width", 0)
+            height = base_image.get("height", 0)
             source = "embedded"
 
         else:
             # Fallback: render the whole page as image
-            zoom = 150 / 72
+            if dpi is None:
+                dpi = settings.map_render_dpi
+            if dpi is None:
+                # Pixel count grows with dpi squared, so only small pages get the higher resolution
+                page_rect = page.rect
+                area_in = (page_rect.width * page_rect.height) / (72 * 72)
+                dpi = _SMALL_PAGE_RENDER_DPI if area_in < _SMALL_PAGE_AREA_IN else _DEFAULT_RENDER_DPI
+            zoom = dpi / 72
             mat = fitz.Matrix(zoom, zoom)
-            pix = page.get_pixmap(matrix=mat)
-            image_bytes = pix.tobytes("png")
+            pix = page.get_pixmap(matrix=mat, alpha=False)
+            # JPEG encodes much faster than PNG and Cloudinary re-encodes on its side anyway
+            image_bytes = pix.tobytes("jpg", jpg_quality=85)
+            img_format = "jpg"
             width = pix.width
             height = pix.height
             source = "page_render"
 
             if output_dir:
+                # Reuse the encoded bytes instead of encoding the pixmap a second time
                 os.makedirs(output_dir, exist_ok=True)
-                filepath = os.path.join(output_dir, "field_map.png")
-                pix.save(filepath)
+                filepath = os.path.join(output_dir, "field_map.jpg")
+                with open(filepath, 'wb') as f:
+                    f.write(image_bytes)
 
         if not image_bytes:
             return {"error": "Could not extract or render map image"}
 
-        # Upload to Cloudinary
-        upload_result = self._upload_to_cloudinary(image_bytes, img_format)
+        return {
+            "bytes": image_bytes,
+            "format": img_format,
+            "width": width,
+            "height": height,
+            "source": source
+        }
 
+    def _map_image_result(self, map_bytes: Dict[str, Any], upload_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the map_image entry from the extracted image and its upload result"""
         if "error" in upload_result:
             return {
-                "source": source,
+                "source": map_bytes["source"],
                 "error": upload_result["error"],
-                "width": width,
-                "height": height,
-                "format": img_format
+                "width": map_bytes["width"],
+                "height": map_bytes["height"],
+                "format": map_bytes["format"]
             }
 
         # Success
@@ -470,12 +549,35 @@ class AgremoReportExtractor:
             "source": "cloudinary",
             "url": upload_result["url"],
             "public_id": upload_result["public_id"],
-            "width": upload_result.get("width", width),
-            "height": upload_result.get("height", height),
-            "format": upload_result.get("format", img_format),
+            "width": upload_result.get("width", map_bytes["width"]),
+            "height": upload_result.get("height", map_bytes["height"]),
+            "format": upload_result.get("format", map_bytes["format"]),
             "bytes": upload_result.get("bytes")
         }
 
+    def _saves_map_file(self, page_num: int, output_dir: Optional[str]) -> bool:
+        """Whether _get_map_bytes writes field_map.jpg: only page renders are saved, and a page
+        is only rendered when it has no embedded image (listing images decodes nothing)"""
+        return bool(output_dir) and page_num < len(self.doc) and not self.doc[page_num].get_images()
+
+    def _extract_map_image(self, page_num: int = 1, output_dir: Optional[str] = None,
+                           dpi: Optional[int] = None) -> Dict[str, Any]:
+        """Extract map image from specified page"""
+        # Without Cloudinary the image is only needed when it is saved to output_dir
+        if not self._cloudinary_enabled and not self._saves_map_file(page_num, output_dir):
+            return {"source": "skipped", "error": _CLOUDINARY_NOT_CONFIGURED}
+
+        map_bytes = self._get_map_bytes(page_num, output_dir, dpi)
+        if "error" in map_bytes:
+            return map_bytes
+
+        if not self._cloudinary_enabled:
+            return self._map_image_result(map_bytes, {"error": _CLOUDINARY_NOT_CONFIGURED})
+
+        # Upload to Cloudinary
+        upload_result = self._upload_to_cloudinary(map_bytes["bytes"], map_bytes["format"])
+        return self._map_image_result(map_bytes, upload_result)
+
     def _calculate_total_from_levels(self) -> None:
         """Calculate total area from levels if not already set (fallback for Flowering format)"""
         levels = self.result["weed_analysis"]["levels"]
@@ -507,31 +609,161 @@ class AgremoReportExtractor:
                 self.result["weed_analysis"]["total_area_hectares"] = round(total_hectares, 2)
                 logger.info(f"Calculated total_area_hectares from levels: {total_hectares} ha")
 
-    def extract(self, output_dir: Optional[str] = None) -> Dict[str, Any]:
-        """Main extraction method"""
+    def extract(self, output_dir: Optional[str] = None, include_map: bool = True,
+                dpi: Optional[int] = None) -> Dict[str, Any]:
+        """Main extraction method; include_map=False skips page 2 (map image decode and upload).
+
+        dpi sets the resolution when the map has to be rendered from the page; by default it
+        comes from settings.map_render_dpi, or is picked from the page size.
+        """
+        self.result["metadata"]["total_pages"] = len(self.doc)
+
+        self._parse_report()
+
+        if include_map and len(self.doc) >= 2:
+            map_data = self._extract_map_image(1, output_dir, dpi)
+            self.result["map_image"] = map_data
+
+        # All pages are read; free MuPDF memory now (the doc property reopens on demand)
+        self.close()
+
+        return self.result
+
+    def _parse_report(self) -> None:
+        """Parse page 1 into the result"""
         if len(self.doc) >= 1:
-            page1_text = self.doc[0].get_text("text")
-            self._parse_page1_text(page1_text)
+            self._parse_page1_text()
 
             # Calculate total from levels if missing (for Flowering PDFs)
             self._calculate_total_from_levels()
 
-        if len(self.doc) >= 2:
-            map_data = self._extract_map_image(1, output_dir)
-            self.result["map_image"] = map_data
+    def _read_map(self, output_dir: Optional[str], include_map: bool,
+                  dpi: Optional[int]) -> Optional[Dict[str, Any]]:
+        """Open the document and read the map for extract_async.
+
+        Without Cloudinary this is the final map_image entry; with it, the image bytes to upload.
+        """
+        self.result["metadata"]["total_pages"] = len(self.doc)
+
+        if not (include_map and len(self.doc) >= 2):
+            return None
+        if not self._cloudinary_enabled:
+            # Nothing to overlap without an upload
+            return self._extract_map_image(1, output_dir, dpi)
+        return self._get_map_bytes(1, output_dir, dpi)
+
+    async def extract_async(self, output_dir: Optional[str] = None, include_map: bool = True,
+                            dpi: Optional[int] = None) -> Dict[str, Any]:
+        """Extraction variant for async callers.
+
+        All MuPDF work runs in the default executor, and the Cloudinary upload runs alongside
+        page 1 parsing.
+        """
+        loop = asyncio.get_running_loop()
+        upload_future = None
+        try:
+            map_data = await self._run_on_doc(loop, self._read_map, output_dir, include_map, dpi)
+            if map_data is not None and self._cloudinary_enabled and "error" not in map_data:
+                # Start the upload now; it only needs the image bytes, not the document
+                upload_future = loop.run_in_executor(
+                    None, self._upload_to_cloudinary, map_data["bytes"], map_data["format"]
+                )
+
+            await self._run_on_doc(loop, self._parse_report)
+
+            # All pages are read and the upload only holds the image bytes; free MuPDF memory now
+            self.close()
+
+            if upload_future is not None:
+                map_data = self._map_image_result(map_data, await upload_future)
+            if map_data is not None:
+                self.result["map_image"] = map_data
+        finally:
+            if upload_future is not None and not upload_future.done():
+                upload_future.cancel()
+            self.close()
 
         return self.result
 
+    def _run_on_doc(self, loop: asyncio.AbstractEventLoop, func, *args) -> "asyncio.Future":
+        """Run a step that reads the document in the executor, shielded so that cancelling the
+        caller leaves _doc_task pending until the thread is actually done with the document"""
+        self._doc_task = loop.run_in_executor(None, func, *args)
+        return asyncio.shield(self._doc_task)
+
     def close(self):
-        if hasattr(self, 'doc') and self.doc:
-            self.doc.close()
-
-
-def extract_pdf_report(pdf_path: str, output_dir: str = None) -> Dict[str, Any]:
-    """Convenience function to extract PDF report"""
-    extractor = AgremoReportExtractor(pdf_path)
-    try:
-        result = extractor.extract(output_dir)
-        return result
-    finally:
-        extractor.close()
\ No newline at end of file
+        if self._doc_task is not None and not self._doc_task.done():
+            # A worker thread still reads the document; closing it now would free pages in use
+            self._doc_task.add_done_callback(lambda _: self.close())
+            return
+        if self._doc is not None:
+            self._doc.close()
+            self._doc = None
+
+
+# Results of extract_pdf_report keyed by (path, mtime_ns, size, include_map). Calls with an
+# output_dir are not cached: they must write field_map.jpg, which may since have been deleted
+_RESULT_CACHE_SIZE = 128
+_result_cache: "OrderedDict[Tuple[str, int, int, bool], Dict[str, Any]]" = OrderedDict()
+_result_cache_lock = threading.Lock()
+
+
+def _is_cacheable(result: Dict[str, Any]) -> bool:
+    """Failed uploads are not cached so that a retry uploads again"""
+    map_image = result.get("map_image") or {}
+    return not map_image.get("error") or map_image.get("source") == "skipped"
+
+
+def extract_pdf_report(pdf_path: str, output_dir: str = None, include_map: bool = True) -> Dict[str, Any]:
+    """Convenience function to extract PDF report, reusing results for unchanged files.
+
+    A reused result is a copy of the first extraction with metadata.extracted_at set to now.
+    """
+    if output_dir is not None:
+        with AgremoReportExtractor(pdf_path) as extractor:
+            return extractor.extract(output_dir, include_map)
+
+    st = os.stat(pdf_path)
+    key = (pdf_path, st.st_mtime_ns, st.st_size, include_map)
+
+    with _result_cache_lock:
+        cached = _result_cache.get(key)
+        if cached is not None:
+            _result_cache.move_to_end(key)
+            result = copy.deepcopy(cached)
+            result["metadata"]["extracted_at"] = datetime.now().isoformat()
+            return result
+
+    with AgremoReportExtractor(pdf_path) as extractor:
+        result = extractor.extract(output_dir, include_map)
+
+    if _is_cacheable(result):
+        with _result_cache_lock:
+            _result_cache[key] = copy.deepcopy(result)
+            if len(_result_cache) > _RESULT_CACHE_SIZE:
+                _result_cache.popitem(last=False)
+
+    return result
+
+
+def extract_pdf_reports(pdf_paths: Iterable[str], output_dir: str = None, include_map: bool = True,
+                        workers: Optional[int] = None) -> Iterator[Tuple[str, Union[Dict[str, Any], Exception]]]:
+    """Extract many PDF reports in parallel processes, yielding (pdf_path, result) as each finishes.
+
+    A file that fails to extract yields (pdf_path, exception) instead, so one bad PDF does not
+    stop the rest of the batch.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(extract_pdf_report, pdf_path, output_dir, include_map): pdf_path
+            for pdf_path in pdf_paths
+        }
+        for future in as_completed(futures):
+            pdf_path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Failed to extract {pdf_path}: {e}")
+                yield pdf_path, e
+            else:
+                yield pdf_path, result
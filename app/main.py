@@ -3,17 +3,18 @@ FastAPI application for drone PDF extraction service.
 """
 
 import os
+import asyncio
 import logging
-import base64
 import binascii
-import tempfile
+from functools import lru_cache, wraps
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 from fastapi import FastAPI, HTTPException, status, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
+import pybase64
 
 from app.config import settings
 from app.models import ExtractRequest, ExtractResponse
@@ -26,6 +27,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Settings read on every request, bound once at import
+MAX_FILE_SIZE = settings.max_file_size
+FILE_TOO_LARGE_ERROR = f"PDF file exceeds maximum size of {MAX_FILE_SIZE} bytes"
+DEBUG_MODE = settings.log_level.upper() == "DEBUG"
+
 # Create FastAPI app
 app = FastAPI(
     title="Drone PDF Extraction Service",
@@ -34,10 +40,10 @@ app = FastAPI(
 )
 
 # Configure CORS
-cors_origins = settings.get_cors_origins_list()
+cors_origins = settings.cors_origins_list
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=cors_origins if "*" not in cors_origins else ["*"],
+    allow_origins=cors_origins if "*" not in cors_origins else ("*",),
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -47,24 +53,113 @@ app.add_middleware(
 # Request logging middleware
 class RequestLoggingMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
-        logger.info(f"Incoming request: {request.method} {request.url}")
-        logger.info(f"Request path: {request.url.path}")
-        logger.info(f"Request query params: {dict(request.query_params)}")
-        
-        # For POST requests, log that we received it (but don't consume the body)
-        if request.method == "POST":
-            logger.info(f"POST request received to {request.url.path}")
-            # Note: We don't read the body here to avoid consuming the stream
-            # FastAPI will handle body parsing in the endpoint
+        # Per-request detail is DEBUG and only built when it will be emitted
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Incoming request: %s %s", request.method, request.url)
+            logger.debug("Request path: %s", request.url.path)
+            logger.debug("Request query params: %s", dict(request.query_params))
+            
+            # For POST requests, log that we received it (but don't consume the body)
+            if request.method == "POST":
+                logger.debug("POST request received to %s", request.url.path)
+                # Note: We don't read the body here to avoid consuming the stream
+                # FastAPI will handle body parsing in the endpoint
         
         response = await call_next(request)
-        logger.info(f"Response status: {response.status_code}")
+        logger.debug("Response status: %s", response.status_code)
         return response
 
 
 app.add_middleware(RequestLoggingMiddleware)
 
 
+@lru_cache(maxsize=1)
+def _extraction_slots() -> asyncio.Semaphore:
+    """Bounds the decoded PDFs held in memory at once; created on first use so it binds to the running loop."""
+    return asyncio.Semaphore(max(1, settings.max_in_flight_bytes // MAX_FILE_SIZE))
+
+
+def _limit_in_flight(endpoint):
+    """
+    Run an extraction endpoint only while an extraction slot is free.
+    
+    FastAPI parses the endpoint's body model before the wrapper runs, so for JSON requests the
+    base64 string is already in memory; the slot bounds its decoded bytes and the extraction.
+    Endpoints taking the raw Request read the body inside the slot.
+    """
+    @wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        async with _extraction_slots():
+            return await endpoint(*args, **kwargs)
+    return wrapper
+
+
+def _decoded_size(content: str) -> int:
+    """Size of the decoded base64 payload, computed from its length without decoding."""
+    # Line breaks of MIME-wrapped base64 are skipped by the decoder, so they are not payload
+    length = len(content) - content.count("\n") - content.count("\r")
+    tail = content[-8:].rstrip()
+    padding = len(tail) - len(tail.rstrip("="))
+    return 3 * (length // 4) - min(padding, 2)
+
+
+async def _extract_pdf(pdf_path: str, pdf_bytes: Optional[bytes] = None) -> Dict[str, Any]:
+    """Extract off the event loop; the map upload overlaps page 1 parsing."""
+    with AgremoReportExtractor(pdf_path, pdf_bytes) as extractor:
+        return await extractor.extract_async()
+
+
+async def _extract_response(pdf_path: str, pdf_bytes: Optional[bytes] = None) -> ExtractResponse:
+    """
+    Validate the PDF header and extract the report off the event loop.
+    
+    Args:
+        pdf_path: Path of the PDF, or only its reported name when pdf_bytes is given
+        pdf_bytes: PDF content already held in memory
+        
+    Returns:
+        ExtractResponse with extracted data or error message
+    """
+    # Validate file extension (check if it's a PDF by reading first bytes)
+    try:
+        if pdf_bytes is not None:
+            header = pdf_bytes[:4]
+        else:
+            with open(pdf_path, 'rb') as f:
+                header = f.read(4)
+        if header != b'%PDF':
+            logger.error("File is not a valid PDF: %s", pdf_path)
+            return ExtractResponse(
+                success=False,
+                error="File is not a valid PDF"
+            )
+    except Exception as e:
+        logger.error("Error validating PDF: %s", e)
+        return ExtractResponse(
+            success=False,
+            error=f"Error validating PDF file: {str(e)}"
+        )
+    
+    # Extract data from PDF
+    try:
+        logger.debug("Starting PDF extraction for: %s", pdf_path)
+        extracted_data = await _extract_pdf(pdf_path, pdf_bytes)
+        
+        logger.info("Successfully extracted data from PDF: %s", pdf_path)
+        
+        return ExtractResponse(
+            success=True,
+            extractedData=extracted_data
+        )
+        
+    except Exception as e:
+        logger.error("Error extracting PDF data: %s", e, exc_info=True)
+        return ExtractResponse(
+            success=False,
+            error=f"Failed to extract PDF data: {str(e)}"
+        )
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
@@ -76,6 +171,7 @@ async def health_check():
 
 
 @app.post("/extract-drone-data", response_model=ExtractResponse)
+@_limit_in_flight
 async def extract_drone_data(request: ExtractRequest) -> ExtractResponse:
     """
     Extract structured data from a drone PDF report.
@@ -86,151 +182,143 @@ async def extract_drone_data(request: ExtractRequest) -> ExtractResponse:
     Returns:
         ExtractResponse with extracted data or error message
     """
-    logger.info("=" * 50)
-    logger.info("Received POST request to /extract-drone-data")
-    logger.info(f"Request received: pdfPath={request.pdfPath is not None}, pdfContent={'present' if request.pdfContent else 'not present'}")
+    logger.debug("=" * 50)
+    logger.debug("Received POST request to /extract-drone-data")
+    logger.debug(
+        "Request received: pdfPath=%s, pdfContent=%s",
+        request.pdfPath is not None, "present" if request.pdfContent else "not present"
+    )
     
-    temp_file_path = None
     pdf_path = None
+    pdf_bytes = None
     
-    try:
-        # Handle base64 content (new method - preferred for production)
-        if request.pdfContent:
-            logger.info("Processing PDF from base64 content")
-            
-            try:
-                # Decode base64 content
-                pdf_bytes = base64.b64decode(request.pdfContent)
-                logger.info(f"Decoded PDF content: {len(pdf_bytes)} bytes")
-                
-                # Validate file size
-                if len(pdf_bytes) > settings.max_file_size:
-                    logger.error(f"PDF file exceeds maximum size: {len(pdf_bytes)} bytes")
-                    return ExtractResponse(
-                        success=False,
-                        error=f"PDF file exceeds maximum size of {settings.max_file_size} bytes"
-                    )
-                
-                # Create temporary file
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-                temp_file_path = temp_file.name
-                temp_file.write(pdf_bytes)
-                temp_file.close()
-                
-                pdf_path = temp_file_path
-                logger.info(f"Created temporary PDF file: {pdf_path}")
-                
-            except (binascii.Error, ValueError) as e:
-                logger.error(f"Invalid base64 encoding: {str(e)}")
-                return ExtractResponse(
-                    success=False,
-                    error=f"Invalid base64 encoding: {str(e)}"
-                )
-            except Exception as e:
-                logger.error(f"Error processing base64 content: {str(e)}", exc_info=True)
-                return ExtractResponse(
-                    success=False,
-                    error=f"Failed to process PDF content: {str(e)}"
-                )
+    # Handle base64 content (new method - preferred for production)
+    if request.pdfContent:
+        logger.debug("Processing PDF from base64 content")
         
-        # Handle file path (legacy method - for backward compatibility)
-        elif request.pdfPath:
-            logger.info(f"Processing PDF from file path: {request.pdfPath}")
-            pdf_path = request.pdfPath
+        # Reject oversized payloads before spending time decoding them
+        decoded_size = _decoded_size(request.pdfContent)
+        if decoded_size > MAX_FILE_SIZE:
+            logger.error("PDF file exceeds maximum size: %s bytes", decoded_size)
+            return ExtractResponse(
+                success=False,
+                error=FILE_TOO_LARGE_ERROR
+            )
+        
+        try:
+            # Decode base64 content (pybase64 is a SIMD drop-in for base64.b64decode)
+            pdf_bytes = pybase64.b64decode(request.pdfContent)
+            logger.debug("Decoded PDF content: %s bytes", len(pdf_bytes))
             
-            # Validate file exists
-            if not os.path.exists(pdf_path):
-                logger.error(f"PDF file not found: {pdf_path}")
+            # Validate file size
+            if len(pdf_bytes) > MAX_FILE_SIZE:
+                logger.error("PDF file exceeds maximum size: %s bytes", len(pdf_bytes))
                 return ExtractResponse(
                     success=False,
-                    error=f"PDF file not found: {pdf_path}"
+                    error=FILE_TOO_LARGE_ERROR
                 )
             
-            # Validate file is readable
-            if not os.access(pdf_path, os.R_OK):
-                logger.error(f"PDF file is not readable: {pdf_path}")
-                return ExtractResponse(
-                    success=False,
-                    error=f"PDF file is not readable: {pdf_path}"
-                )
+            # MuPDF opens the decoded bytes directly, so no temporary file is written;
+            # the name is only reported as the source file
+            pdf_path = "uploaded.pdf"
             
-            # Validate file size
-            file_size = os.path.getsize(pdf_path)
-            if file_size > settings.max_file_size:
-                logger.error(f"PDF file exceeds maximum size: {file_size} bytes")
-                return ExtractResponse(
-                    success=False,
-                    error=f"PDF file exceeds maximum size of {settings.max_file_size} bytes"
-                )
-        else:
-            logger.error("Neither pdfPath nor pdfContent provided")
+        except (binascii.Error, ValueError) as e:
+            logger.error("Invalid base64 encoding: %s", e)
             return ExtractResponse(
                 success=False,
-                error="Either pdfPath or pdfContent must be provided"
+                error=f"Invalid base64 encoding: {str(e)}"
             )
-        
-        # Validate file extension (check if it's a PDF by reading first bytes)
-        try:
-            with open(pdf_path, 'rb') as f:
-                header = f.read(4)
-                if header != b'%PDF':
-                    logger.error(f"File is not a valid PDF: {pdf_path}")
-                    return ExtractResponse(
-                        success=False,
-                        error="File is not a valid PDF"
-                    )
         except Exception as e:
-            logger.error(f"Error validating PDF: {str(e)}")
+            logger.error("Error processing base64 content: %s", e, exc_info=True)
             return ExtractResponse(
                 success=False,
-                error=f"Error validating PDF file: {str(e)}"
+                error=f"Failed to process PDF content: {str(e)}"
             )
+    
+    # Handle file path (legacy method - for backward compatibility)
+    elif request.pdfPath:
+        logger.debug("Processing PDF from file path: %s", request.pdfPath)
+        pdf_path = request.pdfPath
         
-        # Extract data from PDF
-        extractor = None
+        # Validate file exists (one stat also gives the size checked below)
         try:
-            logger.info(f"Starting PDF extraction for: {pdf_path}")
-            extractor = AgremoReportExtractor(pdf_path)
-            
-            extracted_data = extractor.extract()
-            
-            logger.info(f"Successfully extracted data from PDF: {pdf_path}")
-            
+            file_stat = os.stat(pdf_path)
+        except OSError:
+            logger.error("PDF file not found: %s", pdf_path)
             return ExtractResponse(
-                success=True,
-                extractedData=extracted_data
+                success=False,
+                error=f"PDF file not found: {pdf_path}"
             )
-            
-        except Exception as e:
-            logger.error(f"Error extracting PDF data: {str(e)}", exc_info=True)
+        
+        # Validate file is readable
+        if not os.access(pdf_path, os.R_OK):
+            logger.error("PDF file is not readable: %s", pdf_path)
+            return ExtractResponse(
+                success=False,
+                error=f"PDF file is not readable: {pdf_path}"
+            )
+        
+        # Validate file size
+        file_size = file_stat.st_size
+        if file_size > MAX_FILE_SIZE:
+            logger.error("PDF file exceeds maximum size: %s bytes", file_size)
+            return ExtractResponse(
+                success=False,
+                error=FILE_TOO_LARGE_ERROR
+            )
+    else:
+        logger.error("Neither pdfPath nor pdfContent provided")
+        return ExtractResponse(
+            success=False,
+            error="Either pdfPath or pdfContent must be provided"
+        )
+    
+    return await _extract_response(pdf_path, pdf_bytes)
+
+
+@app.post("/extract-drone-data-raw", response_model=ExtractResponse)
+@_limit_in_flight
+async def extract_drone_data_raw(request: Request) -> ExtractResponse:
+    """
+    Extract structured data from a drone PDF report sent as the raw request body.
+    
+    Preferred over base64 pdfContent: the PDF travels without encoding overhead
+    and needs no decoding before extraction.
+    
+    Args:
+        request: Request whose body is the PDF file (Content-Type: application/pdf)
+        
+    Returns:
+        ExtractResponse with extracted data or error message
+    """
+    logger.debug("=" * 50)
+    logger.debug("Received POST request to /extract-drone-data-raw")
+    
+    # Read the body in chunks so an oversized upload is rejected without buffering all of it
+    pdf_bytes = bytearray()
+    async for chunk in request.stream():
+        pdf_bytes += chunk
+        if len(pdf_bytes) > MAX_FILE_SIZE:
+            logger.error("PDF file exceeds maximum size: more than %s bytes received", MAX_FILE_SIZE)
             return ExtractResponse(
                 success=False,
-                error=f"Failed to extract PDF data: {str(e)}"
+                error=FILE_TOO_LARGE_ERROR
             )
-        finally:
-            if extractor:
-                extractor.close()
+    logger.debug("Received PDF content: %s bytes", len(pdf_bytes))
     
-    finally:
-        # Clean up temporary file if created from base64
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.unlink(temp_file_path)
-                logger.info(f"Cleaned up temporary file: {temp_file_path}")
-            except Exception as e:
-                logger.warning(f"Failed to clean up temporary file {temp_file_path}: {str(e)}")
+    return await _extract_response("uploaded.pdf", pdf_bytes)
 
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     """Global exception handler."""
-    logger.error(f"Unhandled exception: {str(exc)}", exc_info=True)
+    logger.error("Unhandled exception: %s", exc, exc_info=True)
     return JSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         content={
             "success": False,
             "error": "Internal server error",
-            "detail": str(exc) if settings.log_level == "DEBUG" else "An unexpected error occurred"
+            "detail": str(exc) if DEBUG_MODE else "An unexpected error occurred"
         }
     )
 
@@ -239,15 +327,18 @@ if __name__ == "__main__":
     import uvicorn
     logger.info("=" * 50)
     logger.info("Starting Drone PDF Extraction Service")
-    logger.info(f"Host: {settings.api_host}")
-    logger.info(f"Port: {settings.api_port}")
-    logger.info(f"Log Level: {settings.log_level}")
+    logger.info("Host: %s", settings.api_host)
+    logger.info("Port: %s", settings.api_port)
+    logger.info("Log Level: %s", settings.log_level)
     logger.info("=" * 50)
     uvicorn.run(
         "app.main:app",
         host=settings.api_host,
         port=settings.api_port,
-        reload=True,
+        # The reload watcher costs CPU on every change scan; only run it when debugging
+        reload=DEBUG_MODE,
+        # C HTTP parser; the loop stays "auto" so uvloop is used where it is installed
+        http="httptools",
         log_level=settings.log_level.lower()
     )
 